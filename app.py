@@ -1,14 +1,27 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, send_file, stream_with_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func, Index
+from sqlalchemy import func, Index, select, inspect
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from datetime import datetime
 import os
+import io
+import csv
 import json
-from datetime import datetime, timezone
+import zlib
+import tempfile
+import click
+from collections import Counter
+from datetime import datetime, timezone, timedelta
 import pytz  # pip install pytz
 import requests
 import time
+import math
+import threading
+from collections import OrderedDict
+from functools import wraps
 from dotenv import load_dotenv
 from openai import OpenAI
 import re
@@ -20,11 +33,18 @@ load_dotenv()  # reads .env and loads variables into the environment
 # App setup
 # -------------------------------------------------------
 app = Flask(__name__)
+# Number of reverse proxies in front of the app that append X-Forwarded-For.
+# Only those hops are trusted; 0 means use the socket peer address as-is.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
 CORS(app, resources={r"/api/*": {"origins": ["https://sunilbasudeo.com", "https://www.sunilbasudeo.com", "http://localhost:3000"]}})
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(BASE_DIR, 'questions.db')}"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# Store TeachingNote bodies zlib-compressed; reads handle both forms either way.
+app.config["COMPRESS_NOTES"] = os.getenv("COMPRESS_NOTES", "0").lower() in ("1", "true", "yes")
 
 db = SQLAlchemy(app)
 
@@ -45,6 +65,51 @@ def get_clerk_user(user_id):
         print(f"⚠️ Clerk fetch failed for {user_id}: {response.status_code}")
         return None
 
+# -------------------------------------------------------
+# Column types
+# -------------------------------------------------------
+class CompressedText(TypeDecorator):
+    """
+    Text column that is zlib-compressed at rest when COMPRESS_NOTES is on.
+    Compressed values are stored as BLOBs, plain values as TEXT, so rows
+    written in either mode read back as str.
+    """
+    impl = db.Text
+    cache_ok = True
+
+    def encode(self, value):
+        return value
+
+    def decode(self, value):
+        return value
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        value = self.encode(value)
+        if app.config.get("COMPRESS_NOTES"):
+            return zlib.compress(value.encode("utf-8"), 6)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, (bytes, memoryview)):
+            value = zlib.decompress(bytes(value)).decode("utf-8")
+        return self.decode(value)
+
+
+class CompressedJSON(CompressedText):
+    """JSON stored as (optionally compressed) text; reads legacy JSON columns too."""
+    cache_ok = True
+
+    def encode(self, value):
+        return json.dumps(value)
+
+    def decode(self, value):
+        return json.loads(value)
+
+
 # -------------------------------------------------------
 # Model
 # -------------------------------------------------------
@@ -128,12 +193,15 @@ class TeachingNote(db.Model):
     topic = db.Column(db.String(200))
     title = db.Column(db.String(250))
     reading_time = db.Column(db.String(50))
-    notes = db.Column(db.Text)
-    summary = db.Column(db.Text)
-    questions = db.Column(db.JSON)  # stores full TF quiz data (answer + explanation)
+    notes = db.Column(CompressedText)
+    summary = db.Column(CompressedText)
+    questions = db.Column(CompressedJSON)  # stores full TF quiz data (answer + explanation)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Columns for listings; leaves the large (possibly compressed) bodies unread
+    SUMMARY_COLUMNS = ("id", "subject", "topic", "title", "reading_time", "created_at")
+
     def serialize(self):
         return {
             "id": self.id,
@@ -147,6 +215,189 @@ class TeachingNote(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
 
+class QuestionFacet(db.Model):
+    """
+    Question counts per (subject, chapter, topic, difficulty).
+    Kept in step with question writes so /api/catalog never scans `question`.
+    Missing keys are stored as '' because SQLite UNIQUE treats NULLs as distinct.
+    """
+    __tablename__ = "question_facets"
+    __table_args__ = (
+        db.UniqueConstraint("subject", "chapter", "topic", "difficulty", name="uq_question_facet"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(100), nullable=False, default="")
+    chapter = db.Column(db.String(150), nullable=False, default="")
+    topic = db.Column(db.String(150), nullable=False, default="")
+    difficulty = db.Column(db.String(50), nullable=False, default="")
+    count = db.Column(db.Integer, nullable=False, default=0)
+    hot_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# -------------------------------------------------------
+# Rate limiting & admission control
+# -------------------------------------------------------
+# Both are in-process: each worker process enforces its own budget.
+
+# route -> (tokens refilled per second, bucket size), per user_id / IP
+RATE_LIMITS = {
+    "quiz_results": (1.0, 5),
+    "generate_notes": (0.1, 3),
+}
+
+# route -> (max concurrent requests, max queued waiters, max wait in seconds)
+CONCURRENCY_LIMITS = {
+    "quiz_results": (8, 64, 1.0),
+    "generate_notes": (4, 8, 2.0),
+}
+
+limiter_stats = Counter()
+limiter_stats_lock = threading.Lock()
+
+
+def count_decision(route, decision):
+    with limiter_stats_lock:
+        limiter_stats[f"{route}.{decision}"] += 1
+
+
+def too_many_requests(message, retry_after):
+    resp = jsonify({"error": message, "retry_after": retry_after})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return resp
+
+
+def client_ip_key():
+    """
+    Client IP. remote_addr honours X-Forwarded-For only via ProxyFix
+    (TRUSTED_PROXY_HOPS), so clients cannot choose it.
+    """
+    return f"ip:{request.remote_addr}"
+
+
+def client_key():
+    """
+    user_id from the JSON body or query string, falling back to client IP.
+    user_id is not authenticated; routes guarding paid calls use client_ip_key.
+    """
+    body = request.get_json(silent=True)
+    user_id = body.get("user_id") if isinstance(body, dict) else None
+    user_id = user_id or request.args.get("user_id")
+    if user_id:
+        return f"user:{user_id}"
+    return client_ip_key()
+
+
+class TokenBucketLimiter:
+    """
+    Thread-safe token buckets keyed by (route, client).
+    Bounded as an LRU: the least recently used bucket is evicted once
+    MAX_BUCKETS is exceeded (an evicted client simply starts full again).
+    """
+
+    MAX_BUCKETS = 10000
+
+    def __init__(self):
+        self.buckets = OrderedDict()  # key -> (tokens, last_refill), oldest first
+        self.lock = threading.Lock()
+
+    def acquire(self, key, rate, burst):
+        """Take one token. Returns (allowed, seconds until a token is available)."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self.buckets[key] = (tokens, now)
+                allowed, retry_after = False, (1 - tokens) / rate
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+class ConcurrencyGate:
+    """Caps in-flight requests; a bounded number may wait briefly for a slot."""
+
+    def __init__(self, max_active, max_waiting, max_wait):
+        self.slots = threading.BoundedSemaphore(max_active)
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.waiting = 0
+        self.lock = threading.Lock()
+
+    def enter(self):
+        if self.slots.acquire(blocking=False):
+            return True
+        with self.lock:
+            if self.waiting >= self.max_waiting:
+                return False
+            self.waiting += 1
+        try:
+            return self.slots.acquire(timeout=self.max_wait)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+    def leave(self):
+        self.slots.release()
+
+
+rate_limiter = TokenBucketLimiter()
+concurrency_gates = {
+    route: ConcurrencyGate(*limits) for route, limits in CONCURRENCY_LIMITS.items()
+}
+
+
+def charge_rate_limit(route, key=None):
+    """
+    Take a token for `route` from the bucket for `key` (default: client_key()).
+    Returns a 429 response when the bucket is empty, else None.
+    """
+    rate, burst = RATE_LIMITS[route]
+    allowed, retry_after = rate_limiter.acquire((route, key or client_key()), rate, burst)
+    if not allowed:
+        count_decision(route, "rate_limited")
+        return too_many_requests("Rate limit exceeded", retry_after)
+    count_decision(route, "allowed")
+    return None
+
+
+def rate_limited(route):
+    """Reject with 429 once the caller's token bucket for `route` is empty."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            limited = charge_rate_limit(route)
+            if limited:
+                return limited
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def admission_controlled(route):
+    """Shed load with 429 when `route` is saturated and its wait queue is full."""
+    gate = concurrency_gates[route]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not gate.enter():
+                count_decision(route, "shed")
+                return too_many_requests("Server busy, please retry", gate.max_wait)
+            count_decision(route, "admitted")
+            try:
+                return view(*args, **kwargs)
+            finally:
+                gate.leave()
+        return wrapper
+    return decorator
+
 
 # -------------------------------------------------------
 # Routes
@@ -155,6 +406,14 @@ class TeachingNote(db.Model):
 @app.route("/api/hello")
 def hello():
     return jsonify(message="Hello from Flask + SQLite (Question DB)")
+
+@app.route("/api/limiter_stats", methods=["GET"])
+def get_limiter_stats():
+    """Counters of rate-limit / admission decisions in this worker process."""
+    with limiter_stats_lock:
+        counters = dict(limiter_stats)
+    waiting = {route: gate.waiting for route, gate in concurrency_gates.items()}
+    return jsonify({"counters": counters, "waiting": waiting})
     
 
 def to_local_time(utc_dt, tz_name="Asia/Kolkata"):
@@ -169,6 +428,104 @@ def to_local_time(utc_dt, tz_name="Asia/Kolkata"):
 
 
 
+def facet_key(subject, chapter, topic, difficulty):
+    return (subject or "", chapter or "", topic or "", difficulty or "")
+
+
+def bump_question_facets(questions):
+    """
+    Add the given (not yet committed) questions to the facet counts.
+    Runs in the caller's session so facets commit atomically with the questions.
+    """
+    counts, hot = Counter(), Counter()
+    for q in questions:
+        key = facet_key(q.subject, q.chapter, q.topic, q.difficulty)
+        counts[key] += 1
+        if q.hot:
+            hot[key] += 1
+    if not counts:
+        return
+
+    # Atomic upsert: concurrent writers add to the stored counts in SQL
+    # rather than read-modify-write in Python.
+    table = QuestionFacet.__table__
+    stmt = sqlite_insert(table).values([
+        {
+            "subject": subject, "chapter": chapter, "topic": topic, "difficulty": difficulty,
+            "count": n, "hot_count": hot[(subject, chapter, topic, difficulty)],
+        }
+        for (subject, chapter, topic, difficulty), n in counts.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["subject", "chapter", "topic", "difficulty"],
+        set_={
+            "count": table.c.count + stmt.excluded.count,
+            "hot_count": table.c.hot_count + stmt.excluded.hot_count,
+        },
+    )
+    db.session.execute(stmt)
+
+
+def rebuild_question_facets():
+    """
+    Recompute question_facets with one GROUP BY over `question`.
+    DELETE + INSERT ... SELECT run in a single transaction, so SQLite's
+    writer lock keeps them consistent with concurrent question writes.
+    """
+    QuestionFacet.__table__.create(db.engine, checkfirst=True)
+
+    table = QuestionFacet.__table__
+    keys = [
+        func.coalesce(Question.subject, ""),
+        func.coalesce(Question.chapter, ""),
+        func.coalesce(Question.topic, ""),
+        func.coalesce(Question.difficulty, ""),
+    ]
+    grouped = select(
+        *keys,
+        func.count(Question.id),
+        func.coalesce(func.sum(db.case((Question.hot == True, 1), else_=0)), 0),  # noqa: E712
+    ).group_by(*keys)
+
+    try:
+        db.session.execute(table.delete())
+        result = db.session.execute(
+            table.insert().from_select(
+                ["subject", "chapter", "topic", "difficulty", "count", "hot_count"], grouped
+            )
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result.rowcount
+
+
+def ensure_question_facets():
+    """
+    Create question_facets if missing and seed it when it is empty but
+    questions exist (e.g. first start after upgrading an existing DB).
+    """
+    QuestionFacet.__table__.create(db.engine, checkfirst=True)
+    has_questions = inspect(db.engine).has_table(Question.__tablename__) and Question.query.first()
+    if has_questions and not QuestionFacet.query.first():
+        rebuild_question_facets()
+    db.session.remove()
+
+
+@app.cli.command("rebuild-facets")
+def rebuild_facets_command():
+    """Create or rebuild the question_facets table from the question table."""
+    n = rebuild_question_facets()
+    click.echo(f"✅ Rebuilt {n} question facets")
+
+
+# Question writes update question_facets, so it must exist (and be seeded)
+# however the app is started: python app.py, flask run or a WSGI server.
+with app.app_context():
+    ensure_question_facets()
+
+
 # Add a new question
 @app.route("/api/questions", methods=["POST"])
 def add_question():
@@ -189,6 +546,7 @@ def add_question():
         giventime=data.get("giventime"),
     )
     db.session.add(q)
+    bump_question_facets([q])
     db.session.commit()
     return jsonify(q.serialize()), 201
 
@@ -199,6 +557,7 @@ def bulk_add_questions():
         return jsonify(error="Expected a JSON array of questions"), 400
 
     added, skipped = 0, 0
+    new_questions = []
     for item in data:
         q = Question(
             difficulty=item.get("difficulty"),
@@ -216,8 +575,10 @@ def bulk_add_questions():
             giventime=item.get("giventime"),
         )
         db.session.add(q)
+        new_questions.append(q)
         added += 1
 
+    bump_question_facets(new_questions)
     db.session.commit()
     return jsonify({"added": added, "skipped": skipped}), 201
 
@@ -228,6 +589,59 @@ def get_questions():
     questions = Question.query.all()
     return jsonify([q.serialize() for q in questions])
 
+@app.route("/api/catalog", methods=["GET"])
+def get_catalog():
+    """
+    Returns the subject -> chapter -> topic navigation tree with question
+    counts (total, hot, per difficulty) and whether each chapter has a
+    TeachingNote (matched on subject + note topic == chapter).
+    Served from question_facets, so cost grows with facets, not questions.
+    """
+    facets = QuestionFacet.query.filter(QuestionFacet.count > 0).all()
+
+    noted = {
+        (subject, topic)
+        for subject, topic in db.session.query(TeachingNote.subject, TeachingNote.topic).distinct()
+    }
+
+    def node(**fields):
+        return {**fields, "count": 0, "hot_count": 0, "difficulties": {}}
+
+    def add(target, facet):
+        target["count"] += facet.count
+        target["hot_count"] += facet.hot_count
+        diff = facet.difficulty or "unknown"
+        target["difficulties"][diff] = target["difficulties"].get(diff, 0) + facet.count
+
+    subjects = {}
+    for f in facets:
+        # '' is the stored form of a missing key; report it as null
+        subject, chapter, topic = f.subject or None, f.chapter or None, f.topic or None
+        s = subjects.setdefault(subject, {**node(subject=subject), "chapters": {}})
+        ch = s["chapters"].setdefault(chapter, {
+            **node(chapter=chapter),
+            "has_notes": (subject, chapter) in noted,
+            "topics": {},
+        })
+        t = ch["topics"].setdefault(topic, node(topic=topic))
+        for target in (s, ch, t):
+            add(target, f)
+
+    catalog = []
+    for s in sorted(subjects.values(), key=lambda x: x["subject"] or ""):
+        chapters = []
+        for ch in sorted(s["chapters"].values(), key=lambda x: x["chapter"] or ""):
+            ch["topics"] = sorted(ch["topics"].values(), key=lambda x: x["topic"] or "")
+            chapters.append(ch)
+        s["chapters"] = chapters
+        catalog.append(s)
+
+    return jsonify({
+        "total": sum(s["count"] for s in catalog),
+        "hot_total": sum(s["hot_count"] for s in catalog),
+        "subjects": catalog,
+    })
+
 # Get one question by ID
 @app.route("/api/questions/<int:id>", methods=["GET"])
 def get_question(id):
@@ -269,6 +683,8 @@ def search_questions():
     })
     
 @app.route("/api/quiz_results", methods=["POST"])
+@rate_limited("quiz_results")
+@admission_controlled("quiz_results")
 def save_quiz_results():
     data = request.get_json()
     user_id = data.get("user_id")
@@ -556,7 +972,215 @@ def get_all_quiz_results():
 
     return jsonify([r.serialize() for r in results])
 
+# -------------------------------------------------------
+# Quiz results export (streamed, constant memory)
+# -------------------------------------------------------
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MAX_BATCH_SIZE = 5000  # cap for the unauthenticated HTTP endpoint
+EXPORT_COLUMNS = [c.name for c in QuizResult.__table__.columns]
+
+
+def parse_export_date(value):
+    """Parse a YYYY-MM-DD string, returning None when not supplied."""
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def build_export_query(start_date=None, end_date=None, user_id=None, subject=None):
+    """
+    Core SELECT over quiz_results ordered by id.
+    end_date is inclusive (the whole day is exported).
+    Raises ValueError on a malformed date.
+    """
+    table = QuizResult.__table__
+    stmt = select(table).order_by(table.c.id)
+
+    start = parse_export_date(start_date)
+    end = parse_export_date(end_date)
+    if start:
+        stmt = stmt.where(table.c.timestamp >= start)
+    if end:
+        stmt = stmt.where(table.c.timestamp < end + timedelta(days=1))
+    if user_id:
+        stmt = stmt.where(table.c.user_id == user_id)
+    if subject:
+        stmt = stmt.where(func.lower(table.c.meta["subject"].as_string()) == subject.lower())
+    return stmt
+
+
+def export_row(row):
+    """Flatten a quiz_results row into plain CSV/Parquet friendly values."""
+    data = dict(row._mapping)
+    data["timestamp"] = data["timestamp"].isoformat() if data["timestamp"] else None
+    data["meta"] = json.dumps(data["meta"]) if data["meta"] is not None else None
+    return data
+
+
+def iter_export_batches(stmt, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields lists of row dicts, batch_size at a time, using keyset
+    pagination on id. Each batch is one short statement, so no read
+    lock is held while the client downloads and only one batch is
+    ever held in memory.
+    """
+    table = QuizResult.__table__
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            stmt.where(table.c.id > last_id).limit(batch_size)
+        ).all()
+        db.session.commit()  # end the read transaction between batches
+        if not rows:
+            break
+        last_id = rows[-1].id
+        yield [export_row(row) for row in rows]
+        if len(rows) < batch_size:
+            break
+
+
+def iter_csv_gzip(batches):
+    """Encode row batches as CSV and yield gzip compressed chunks."""
+    compressor = zlib.compressobj(wbits=31)  # 31 -> gzip container
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS)
+
+    def drain():
+        chunk = compressor.compress(buf.getvalue().encode("utf-8"))
+        buf.seek(0)
+        buf.truncate(0)
+        return chunk
+
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        chunk = drain()
+        if chunk:
+            yield chunk
+    yield drain() + compressor.flush()
+
+
+def write_parquet(batches, path):
+    """
+    Write row batches to a Parquet file, one row group per batch.
+    Needs pandas + pyarrow; raises RuntimeError when they are missing.
+    """
+    try:
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pandas and pyarrow to be installed")
+
+    def arrow_type(column):
+        # export_row renders timestamps and JSON as strings
+        if isinstance(column.type, db.Boolean):
+            return pa.bool_()
+        if isinstance(column.type, db.Integer):
+            return pa.int64()
+        if isinstance(column.type, db.Float):
+            return pa.float64()
+        return pa.string()
+
+    columns = QuizResult.__table__.columns
+    schema = pa.schema([(name, arrow_type(columns[name])) for name in EXPORT_COLUMNS])
+
+    with pq.ParquetWriter(path, schema, compression="snappy") as writer:
+        for batch in batches:
+            frame = pd.DataFrame(batch, columns=EXPORT_COLUMNS)
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+
+
+@app.route("/api/quiz_results/export", methods=["GET"])
+def export_quiz_results():
+    """
+    Streams quiz results as a download without loading the table into memory.
+    Query params:
+      - format (csv|parquet): defaults to csv (gzip'd)
+      - start_date, end_date (YYYY-MM-DD, inclusive)
+      - user_id (str): exact user_id
+      - subject (str): case-insensitive match on meta.subject
+      - batch_size (int): rows fetched per round trip, max 5000
+    """
+    fmt = request.args.get("format", default="csv", type=str).lower()
+    batch_size = request.args.get("batch_size", default=EXPORT_BATCH_SIZE, type=int)
+
+    if fmt not in ("csv", "parquet"):
+        return jsonify({"error": "format must be csv or parquet"}), 400
+    if batch_size < 1:
+        return jsonify({"error": "batch_size must be positive"}), 400
+    batch_size = min(batch_size, EXPORT_MAX_BATCH_SIZE)
+
+    try:
+        stmt = build_export_query(
+            start_date=request.args.get("start_date"),
+            end_date=request.args.get("end_date"),
+            user_id=request.args.get("user_id"),
+            subject=request.args.get("subject"),
+        )
+    except ValueError:
+        return jsonify({"error": "dates must be YYYY-MM-DD"}), 400
+
+    stamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    batches = iter_export_batches(stmt, batch_size)
+
+    if fmt == "csv":
+        return Response(
+            stream_with_context(iter_csv_gzip(batches)),
+            mimetype="application/gzip",
+            headers={"Content-Disposition": f"attachment; filename=quiz_results_{stamp}.csv.gz"},
+        )
+
+    # Parquet needs its footer written last, so spool to a temp file
+    # (on disk, not in memory) and stream that back.
+    tmp = tempfile.NamedTemporaryFile(suffix=".parquet", delete=False)
+    tmp.close()
+    try:
+        write_parquet(batches, tmp.name)
+        fh = open(tmp.name, "rb")
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+    finally:
+        os.remove(tmp.name)  # the open handle keeps the data readable
+
+    return send_file(
+        fh,
+        mimetype="application/vnd.apache.parquet",
+        as_attachment=True,
+        download_name=f"quiz_results_{stamp}.parquet",
+    )
+
+
+@app.cli.command("export-quiz-results")
+@click.argument("output")
+@click.option("--format", "fmt", type=click.Choice(["csv", "parquet"]), default="csv", show_default=True)
+@click.option("--start-date", help="YYYY-MM-DD, inclusive")
+@click.option("--end-date", help="YYYY-MM-DD, inclusive")
+@click.option("--user-id")
+@click.option("--subject")
+@click.option("--batch-size", type=click.IntRange(min=1), default=EXPORT_BATCH_SIZE, show_default=True)
+def export_quiz_results_command(output, fmt, start_date, end_date, user_id, subject, batch_size):
+    """Export quiz results to OUTPUT as gzip'd CSV or Parquet."""
+    try:
+        stmt = build_export_query(start_date, end_date, user_id, subject)
+    except ValueError:
+        raise click.BadParameter("dates must be YYYY-MM-DD")
+
+    batches = iter_export_batches(stmt, batch_size)
+    if fmt == "parquet":
+        try:
+            write_parquet(batches, output)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+    else:
+        with open(output, "wb") as fh:
+            for chunk in iter_csv_gzip(batches):
+                fh.write(chunk)
+
+    click.echo(f"✅ Exported quiz results to {output}")
+
 @app.route("/api/generate_notes", methods=["POST"])
+@admission_controlled("generate_notes")
 def generate_notes():
     data = request.get_json()
     subject = data.get("subject", "Negotiable Instruments Act")
@@ -570,6 +1194,12 @@ def generate_notes():
         print("⚡ Cached note found — skipping OpenAI call")
         return jsonify(existing.serialize())
 
+    # Only cache misses cost an OpenAI call, so only they spend a token.
+    # Keyed by IP: a body-supplied user_id could be changed on every call.
+    limited = charge_rate_limit("generate_notes", key=client_ip_key())
+    if limited:
+        return limited
+
     prompt = f"""
     Generate explanatory student notes for CA Foundation – {subject}.
     Topic: {topic}.
@@ -694,6 +1324,43 @@ def get_all_notes():
     notes = TeachingNote.query.order_by(TeachingNote.created_at.desc()).all()
     return jsonify([n.serialize() for n in notes])
 
+@app.route("/api/notes/summary", methods=["GET"])
+def get_notes_summary():
+    """
+    Lightweight notes listing (no notes/summary/questions bodies), newest first.
+    Keyset paginated on id, which grows with created_at.
+    Query params:
+      - limit (int): page size, default 50, max 200
+      - before_id (int): return notes with id < before_id (use next_before_id)
+      - subject (str): exact subject filter
+    """
+    limit = min(max(request.args.get("limit", default=50, type=int), 1), 200)
+    before_id = request.args.get("before_id", type=int)
+    subject = request.args.get("subject", type=str)
+
+    columns = [getattr(TeachingNote, c) for c in TeachingNote.SUMMARY_COLUMNS]
+    query = db.session.query(*columns)
+    if subject:
+        query = query.filter(TeachingNote.subject == subject)
+    if before_id is not None:
+        query = query.filter(TeachingNote.id < before_id)
+
+    rows = query.order_by(TeachingNote.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        item = dict(row._mapping)
+        item["created_at"] = item["created_at"].isoformat() if item["created_at"] else None
+        items.append(item)
+
+    return jsonify({
+        "items": items,
+        "limit": limit,
+        "next_before_id": items[-1]["id"] if has_more else None,
+    })
+
 @app.route("/api/get_topics", methods=["GET"])
 def get_topics():
     subject = request.args.get("subject")
@@ -713,6 +1380,49 @@ def get_topics():
     return jsonify({"topics": topics})
 
 
+@app.cli.command("compress-notes")
+@click.option("--decompress", is_flag=True, help="Rewrite bodies back to plain text.")
+@click.option("--batch-size", type=click.IntRange(min=1), default=200, show_default=True)
+@click.option("--vacuum", is_flag=True, help="Run VACUUM afterwards to reclaim freed pages.")
+def compress_notes_command(decompress, batch_size, vacuum):
+    """Rewrite existing TeachingNote bodies compressed (or plain with --decompress)."""
+    app.config["COMPRESS_NOTES"] = not decompress
+    table = TeachingNote.__table__
+
+    rewritten, last_id = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.notes, table.c.summary, table.c.questions)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            # Values come back decoded; writing them re-encodes in the target mode
+            db.session.execute(
+                table.update()
+                .where(table.c.id == row.id)
+                .values(
+                    notes=row.notes,
+                    summary=row.summary,
+                    questions=row.questions,
+                    updated_at=table.c.updated_at,  # not a content change
+                )
+            )
+        db.session.commit()
+        rewritten += len(rows)
+        last_id = rows[-1].id
+
+    if vacuum:
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("VACUUM")
+
+    mode = "plain" if decompress else "compressed"
+    click.echo(f"✅ Rewrote {rewritten} teaching notes as {mode}")
+
+
 # -------------------------------------------------------
 # Initialize DB
 # -------------------------------------------------------